@@ -1,12 +1,43 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+import email.message
+
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+from fastapi.openapi.constants import REF_PREFIX
+from fastapi.openapi.models import OpenAPI
+from fastapi.openapi.utils import (
+    get_openapi,
+    validation_error_definition,
+    validation_error_response_definition,
+)
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional, Dict, Tuple, Union
+from bisect import bisect_left
 from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+import orjson
+
+
+class OrjsonResponse(JSONResponse):
+    """
+    JSONResponse serializada con orjson.
+
+    Los endpoints devuelven esta respuesta ya construida, así FastAPI no
+    pasa el contenido por jsonable_encoder + json.dumps.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
 
 app = FastAPI(
     title="PunterX EV Lab - Outrights",
     version="0.1.0",
     description="Servicio EV para apuestas futuras (outrights) de torneos de fútbol.",
+    default_response_class=OrjsonResponse,
 )
 
 
@@ -60,21 +91,40 @@ OUTRIGHTS_PRIORITY: Dict[str, str] = {
     "soccer_uefa_europa_league_winner": "media",
 }
 
+PRIORITY_LEVEL_FACTOR: Dict[str, float] = {
+    "alta": 1.0,
+    "media": 0.7,
+    "baja": 0.4,
+}
+
+# Tabla sport_key -> factor, resuelta una vez al importar.
+OUTRIGHTS_PRIORITY_FACTOR: Dict[str, float] = {
+    sport_key: PRIORITY_LEVEL_FACTOR[level]
+    for sport_key, level in OUTRIGHTS_PRIORITY.items()
+}
+
 
 def _priority_factor(sport_key: Optional[str]) -> float:
     if not sport_key:
         return 0.4
-    level = OUTRIGHTS_PRIORITY.get(sport_key, "baja")
-    if level == "alta":
-        return 1.0
-    if level == "media":
-        return 0.7
-    return 0.4  # baja
+    return OUTRIGHTS_PRIORITY_FACTOR.get(sport_key, 0.4)  # baja
+
+
+# Tramos de _time_factor: días hasta el inicio <= edge (bisect_left).
+TIME_EDGES_DAYS = (0.0, 7.0, 30.0, 365.0)
+TIME_FACTORS = (0.0, 1.0, 0.7, 0.4, 0.1)
 
+# Tramos de _price_factor: cuota <= edge (bisect_left).
+PRICE_EDGES = (1.3, 2.5, 6.0, 15.0, 30.0, 60.0, 200.0)
+PRICE_FACTORS = (0.0, 0.5, 1.0, 0.8, 0.5, 0.3, 0.2, 0.0)
+_PRICE_EDGES_NP = np.array(PRICE_EDGES)
+_PRICE_FACTORS_NP = np.array(PRICE_FACTORS)
 
-def _time_factor(commence_time: Optional[datetime]) -> float:
+
+def _time_factor(commence_time: Optional[datetime], now: datetime) -> float:
     """
     Factor de 0..1 según la distancia en días al inicio del torneo.
+    commence_time debe venir ya con tzinfo (UTC si era naive).
 
     - <= 0 días: 0.0 (ya empezó o está en el pasado).
     - > 365 días: 0.1 (demasiado lejos, casi sin señal).
@@ -85,141 +135,164 @@ def _time_factor(commence_time: Optional[datetime]) -> float:
     if not commence_time:
         return 0.0
 
-    now = datetime.now(timezone.utc)
-    if commence_time.tzinfo is None:
-        commence_time = commence_time.replace(tzinfo=timezone.utc)
-
     delta_days = (commence_time - now).total_seconds() / 86400.0
-
-    if delta_days <= 0:
-        return 0.0
-    if delta_days > 365:
-        return 0.1
-    if delta_days > 30:
-        return 0.4
-    if delta_days > 7:
-        return 0.7
-    return 1.0  # 0..7 días
+    return TIME_FACTORS[bisect_left(TIME_EDGES_DAYS, delta_days)]
 
 
+@lru_cache(maxsize=1024)
 def _price_factor(price: float) -> float:
     """
     Factor heurístico según el rango de cuota.
 
-    Buscamos evitar favoritos ultra cortos y super-longshots,
-    y priorizar cuotas "semi-realistas" tipo 3-6, 6-15, etc.
+    Buscamos evitar favoritos ultra cortos (<= 1.3) y super-longshots
+    (> 200), y priorizar cuotas "semi-realistas" tipo 3-6, 6-15, etc.
+    Cacheado por cuota exacta: las casas repiten las mismas cuotas.
     """
-    if price <= 1.3 or price > 200:
-        return 0.0
-    if 1.3 < price <= 2.5:
-        return 0.5
-    if 2.5 < price <= 6.0:
-        return 1.0
-    if 6.0 < price <= 15.0:
-        return 0.8
-    if 15.0 < price <= 30.0:
-        return 0.5
-    if 30.0 < price <= 60.0:
-        return 0.3
-    return 0.2  # 60..200 pero no tan extremos
-
-
-def _compute_ev_raw(time_f: float, price_f: float, priority_f: float) -> float:
+    return PRICE_FACTORS[bisect_left(PRICE_EDGES, price)]
+
+
+def _price_factors_np(prices: np.ndarray) -> np.ndarray:
+    """
+    Versión vectorizada de _price_factor (mismos tramos de cuota).
+    """
+    return _PRICE_FACTORS_NP[np.searchsorted(_PRICE_EDGES_NP, prices, side="left")]
+
+
+# Máximo valor que puede devolver _price_factor.
+MAX_PRICE_FACTOR = max(PRICE_FACTORS)
+
+# A partir de cuántos candidatos conviene pasar el scoring a NumPy; por
+# debajo, el costo de armar los arrays supera al loop en Python.
+VECTORIZE_MIN_CANDIDATES = 96
+
+
+@lru_cache(maxsize=256)
+def _outright_market_key(key: Optional[str]) -> Optional[str]:
     """
-    Combina los factores en un score 0..1 y lo escala a un rango EV 0..0.25 aprox.
+    Key del market en minúsculas si es tipo 'outrights' / 'winner'; si no, None.
+    Cacheado: las casas repiten las mismas keys en cada evento.
     """
-    score = (0.4 * time_f) + (0.4 * price_f) + (0.2 * priority_f)
-    score_clamped = max(0.0, min(1.0, score))
-    ev = 0.25 * score_clamped
-    return round(ev, 3)
+    key = (key or "").lower()
+    if "outright" not in key and key not in ("outrights", "winner"):
+        return None
+    return key
 
 
-def _flatten_candidates(event: Event):
+def _flatten_candidates(
+    event: Event,
+) -> Tuple[List[str], List[str], List[float], List[str]]:
     """
-    Devuelve una lista de candidatos:
-    [(bookmaker_title, outcome_name, price, market_key)]
+    Devuelve los candidatos como listas paralelas:
+    (bookmaker_titles, outcome_names, prices, market_keys)
     tomando solo markets tipo 'outrights' / 'winner'.
+
+    El scoring solo necesita las cuotas; con listas separadas pasan
+    directo a NumPy y el resto se lee solo para el candidato elegido.
     """
-    candidates = []
+    titles: List[str] = []
+    names: List[str] = []
+    prices: List[float] = []
+    keys: List[str] = []
     for bm in event.bookmakers:
         title = bm.title or "Unknown"
         for mk in bm.markets:
-            key = (mk.key or "").lower()
-            if "outright" not in key and key not in ("outrights", "winner"):
+            key = _outright_market_key(mk.key)
+            if key is None:
                 continue
             for outcome in mk.outcomes:
-                try:
-                    price = float(outcome.price)
-                except (TypeError, ValueError):
+                # Outcome.price ya viene validado como float por Pydantic.
+                price = outcome.price
+                if not price > 1.0:  # también descarta NaN
                     continue
-                if price <= 1.0:
-                    continue
-                candidates.append((title, outcome.name, price, key))
-    return candidates
+                titles.append(title)
+                names.append(outcome.name)
+                prices.append(price)
+                keys.append(key)
+    return titles, names, prices, keys
+
+
+def _no_value(edge_reason: str) -> dict:
+    """Respuesta estándar cuando no hay selección con valor."""
+    return {
+        "ev": 0.0,
+        "selection_name": "N/A",
+        "selection_key": None,
+        "price": 1.0,
+        "bookmaker_title": "N/A",
+        "edge_reason": edge_reason,
+    }
 
 
-def score_outright_event(event_dict: dict) -> OutrightsResponse:
+def score_outright_event(event: Union[Event, Dict[str, Any]]) -> dict:
     """
     Función principal de modelo.
-    Recibe un event (dict como viene de OddsAPI) y devuelve OutrightsResponse.
+    Recibe un Event ya validado (camino del endpoint) o un dict crudo como
+    viene de OddsAPI, y devuelve un dict con la forma de OutrightsResponse.
+
+    Un Event se usa tal cual, sin re-validar. Un dict se valida una sola
+    vez con Event.model_validate: model_construct no sirve ahí porque no
+    convierte commence_time ni los bookmakers anidados.
     """
-    event = Event.parse_obj(event_dict)
+    if not isinstance(event, Event):
+        event = Event.model_validate(event)
 
     if not event.bookmakers:
-        return OutrightsResponse(
-            ev=0.0,
-            selection_name="N/A",
-            selection_key=None,
-            price=1.0,
-            bookmaker_title="N/A",
-            edge_reason="Sin bookmakers en el evento; no se puede evaluar EV.",
-        )
+        return _no_value("Sin bookmakers en el evento; no se puede evaluar EV.")
 
-    candidates = _flatten_candidates(event)
-    if not candidates:
-        return OutrightsResponse(
-            ev=0.0,
-            selection_name="N/A",
-            selection_key=None,
-            price=1.0,
-            bookmaker_title="N/A",
-            edge_reason="Sin outcomes válidos de outrights en el evento.",
-        )
+    titles, names, prices, keys = _flatten_candidates(event)
+    if not prices:
+        return _no_value("Sin outcomes válidos de outrights en el evento.")
 
-    time_f = _time_factor(event.commence_time)
-    priority_f = _priority_factor(event.sport_key)
+    # Un solo "now" por request, compartido por el factor temporal y el texto.
+    now = datetime.now(timezone.utc)
+    commence_time = event.commence_time
+    if commence_time and commence_time.tzinfo is None:
+        commence_time = commence_time.replace(tzinfo=timezone.utc)
 
-    best = None
-    best_ev = -1.0
+    time_f = _time_factor(commence_time, now)
+    priority_f = _priority_factor(event.sport_key)
 
-    for (bm_title, outcome_name, price, mkey) in candidates:
-        price_f = _price_factor(price)
-        ev_val = _compute_ev_raw(time_f, price_f, priority_f)
-        if ev_val > best_ev:
-            best_ev = ev_val
-            best = (bm_title, outcome_name, price, mkey)
+    # Los factores se combinan en un score 0..1 que se escala a un rango
+    # EV 0..0.25 aprox: score = 0.4*time_f + 0.4*price_f + 0.2*priority_f.
+    # La parte del evento es constante para todos los candidatos.
+    base_score = (0.4 * time_f) + (0.2 * priority_f)
 
-    if best is None or best_ev <= 0:
-        return OutrightsResponse(
-            ev=0.0,
-            selection_name="N/A",
-            selection_key=None,
-            price=1.0,
-            bookmaker_title="N/A",
-            edge_reason="Modelo heurístico no encontró valor en este torneo.",
-        )
+    # Tope de EV alcanzable con la mejor cuota posible: en el loop se corta
+    # al alcanzarlo.
+    max_ev = 0.25 * max(0.0, min(1.0, base_score + 0.4 * MAX_PRICE_FACTOR))
 
-    bm_title, outcome_name, price, mkey = best
-    selection_key = f"{mkey}:{outcome_name}"
+    best: Optional[int] = None
+    best_ev = -1.0
 
-    now = datetime.now(timezone.utc)
-    if event.commence_time and event.commence_time.tzinfo is None:
-        event_ct = event.commence_time.replace(tzinfo=timezone.utc)
+    if len(prices) >= VECTORIZE_MIN_CANDIDATES:
+        price_arr = np.array(prices, dtype=np.float64)
+        ev_vals = 0.25 * np.clip(base_score + 0.4 * _price_factors_np(price_arr), 0.0, 1.0)
+        # argmax devuelve el primer máximo, igual que el loop con ">".
+        best = int(ev_vals.argmax())
+        best_ev = float(ev_vals[best])
     else:
-        event_ct = event.commence_time
+        for i, price in enumerate(prices):
+            price_f = _price_factor(price)
+            if price_f == 0.0 and best is not None:
+                continue  # no puede superar a ningún candidato ya visto
+            ev_val = 0.25 * max(0.0, min(1.0, base_score + 0.4 * price_f))
+            if ev_val > best_ev:
+                best_ev = ev_val
+                best = i
+                if ev_val >= max_ev:
+                    break  # nadie después puede superarlo (gana el primero)
+
+    best_ev = round(best_ev, 3)
+    if best is None or best_ev <= 0:
+        return _no_value("Modelo heurístico no encontró valor en este torneo.")
+
+    bm_title = titles[best]
+    outcome_name = names[best]
+    price = prices[best]
+    selection_key = f"{keys[best]}:{outcome_name}"
 
-    if event_ct:
-        days_to_start = (event_ct - now).total_seconds() / 86400.0
+    if commence_time:
+        days_to_start = (commence_time - now).total_seconds() / 86400.0
         days_txt = f"{days_to_start:.1f} días"
     else:
         days_txt = "desconocido"
@@ -233,45 +306,175 @@ def score_outright_event(event_dict: dict) -> OutrightsResponse:
         f"Factores considerados: ventana temporal, rango de cuota y prioridad del torneo."
     )
 
-    return OutrightsResponse(
-        ev=best_ev,
-        selection_name=outcome_name,
-        selection_key=selection_key,
-        price=price,
-        bookmaker_title=bm_title,
-        edge_reason=edge_reason,
-    )
+    return {
+        "ev": best_ev,
+        "selection_name": outcome_name,
+        "selection_key": selection_key,
+        "price": price,
+        "bookmaker_title": bm_title,
+        "edge_reason": edge_reason,
+    }
 
 
 # --------- Endpoints HTTP --------- #
 
-@app.get("/health")
-def health() -> dict:
-    return {
-        "status": "ok",
-        "service": "ev-outrights",
-        "version": "0.1.0",
-    }
+# El body de /health es fijo: se serializa una sola vez al importar.
+_HEALTH_BODY = orjson.dumps({
+    "status": "ok",
+    "service": "ev-outrights",
+    "version": "0.1.0",
+})
+
+
+@app.get("/health", response_model=Dict[str, Any])
+async def health() -> Response:
+    # Al devolver un Response, FastAPI no aplica response_model; queda solo
+    # para documentar el schema en OpenAPI.
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
 
+def _is_json_content_type(content_type: Optional[str]) -> bool:
+    """application/json o application/*+json, igual que FastAPI."""
+    if not content_type:
+        return False
+    message = email.message.Message()
+    message["content-type"] = content_type
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
 
-@app.post("/ev/outrights/score", response_model=OutrightsResponse)
-def ev_outrights_score(payload: OutrightsRequest) -> OutrightsResponse:
+
+async def _read_outrights_request(request: Request) -> OutrightsRequest:
+    """
+    Lee y valida el body de /ev/outrights/score con orjson.
+
+    Replica el contrato de un body OutrightsRequest en FastAPI: body vacío
+    o null -> 422 "missing"; content-type que no es JSON -> el body queda
+    como bytes y no valida; JSON inválido -> 422 "json_invalid".
+    """
+    raw = await request.body()
+    body: Any = None
+    if raw:
+        if _is_json_content_type(request.headers.get("content-type")):
+            try:
+                body = orjson.loads(raw)
+            except orjson.JSONDecodeError as exc:
+                raise RequestValidationError(
+                    [{
+                        "type": "json_invalid",
+                        "loc": ("body", exc.pos),
+                        "msg": "JSON decode error",
+                        "input": {},
+                        "ctx": {"error": exc.msg},
+                    }],
+                    body=raw,
+                )
+        else:
+            body = raw
+
+    if body is None:
+        raise RequestValidationError(
+            [{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}],
+            body=raw,
+        )
+
+    try:
+        # from_attributes=True como FastAPI, para los mismos tipos de error.
+        return OutrightsRequest.model_validate(body, from_attributes=True)
+    except ValidationError as exc:
+        errors = exc.errors(include_url=False)
+        for err in errors:
+            err["loc"] = ("body", *err["loc"])
+        raise RequestValidationError(errors, body=body)
+
+
+@app.post(
+    "/ev/outrights/score",
+    response_model=None,
+    responses={
+        200: {"model": OutrightsResponse},
+        422: {
+            "description": "Validation Error",
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": REF_PREFIX + "HTTPValidationError"},
+                },
+            },
+        },
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": REF_PREFIX + "OutrightsRequest"},
+                },
+            },
+        },
+    },
+)
+async def ev_outrights_score(request: Request) -> OrjsonResponse:
     """
     Endpoint que consumirá punterx-core (OUTRIGHTS_EV_URL).
 
     Recibe:  { "event": { ... } }
     Devuelve: { ev, selection_name, selection_key, price, bookmaker_title, edge_reason }
     """
-    event_dict = payload.event.dict()
+    # Es async: el scoring es CPU puro de microsegundos y no vale la pena el
+    # salto al threadpool de Starlette. El body se lee crudo, se parsea con
+    # orjson y se valida una sola vez contra OutrightsRequest; los errores
+    # siguen saliendo como 422 igual que con la validación de FastAPI.
+    # La respuesta se serializa directo con orjson, sin validación de
+    # response_model ni jsonable_encoder. OutrightsRequest, OutrightsResponse
+    # y los errores 422 quedan en OpenAPI solo como documentación (ver _openapi).
+    payload = await _read_outrights_request(request)
+
     try:
-        return score_outright_event(event_dict)
+        result = score_outright_event(payload.event)
     except Exception as exc:
         # En producción real se podría loguear con más detalle.
-        return OutrightsResponse(
-            ev=0.0,
-            selection_name="Error",
-            selection_key=None,
-            price=1.0,
-            bookmaker_title="N/A",
-            edge_reason=f"error_modelo: {exc}",
+        result = {
+            "ev": 0.0,
+            "selection_name": "Error",
+            "selection_key": None,
+            "price": 1.0,
+            "bookmaker_title": "N/A",
+            "edge_reason": f"error_modelo: {exc}",
+        }
+    return OrjsonResponse(result)
+
+
+# --------- OpenAPI --------- #
+
+def _openapi() -> Dict[str, Any]:
+    """
+    OpenAPI de FastAPI + los schemas del body de /ev/outrights/score.
+
+    El endpoint de score lee el body crudo, así que FastAPI no registra
+    OutrightsRequest ni los schemas de error 422; se agregan aquí para que
+    /openapi.json quede igual que con un body declarado.
+    """
+    if app.openapi_schema is None:
+        schema = get_openapi(
+            title=app.title,
+            version=app.version,
+            description=app.description,
+            routes=app.routes,
         )
+        request_schema = OutrightsRequest.model_json_schema(
+            ref_template=REF_PREFIX + "{model}"
+        )
+        schemas = schema.setdefault("components", {}).setdefault("schemas", {})
+        schemas.update(request_schema.pop("$defs", {}))
+        schemas["OutrightsRequest"] = request_schema
+        schemas["ValidationError"] = validation_error_definition
+        schemas["HTTPValidationError"] = validation_error_response_definition
+        # Misma normalización final que get_openapi (sin "default": null, etc.).
+        app.openapi_schema = jsonable_encoder(
+            OpenAPI(**schema), by_alias=True, exclude_none=True
+        )
+    return app.openapi_schema
+
+
+app.openapi = _openapi
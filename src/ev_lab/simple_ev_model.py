@@ -9,12 +9,37 @@ Objetivo:
 - Mantener un rango razonable de EV (0..0.10 por ahora).
 """
 
+import re
+from bisect import bisect_left
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 
 
-@dataclass
+_KEYWORDS = (
+    "world cup",
+    "champions league",
+    "premier league",
+    "la liga",
+    "serie a",
+    "bundesliga",
+    "ligue 1",
+    "europa league",
+)
+
+# Una sola pasada en C por el nombre de la liga en vez de un "in" por keyword.
+_BIG_LEAGUE_RE = re.compile("|".join(map(re.escape, _KEYWORDS)), re.IGNORECASE)
+
+
+# Bump por ventana de tiempo, en minutos hasta el inicio (<= edge):
+# 0-6 h: +0.04, 6-24 h: +0.03, 1-3 días: +0.02, 3-7 días: +0.01,
+# más de 7 días (o ya empezado): sin bump extra.
+_MIN_EDGES = (6 * 60, 24 * 60, 3 * 1440, 7 * 1440)
+_MIN_BUMPS = (0.04, 0.03, 0.02, 0.01, 0.0)
+
+
+@dataclass(slots=True)
 class EvPrediction:
     fixture_id: str
     market: str
@@ -24,7 +49,25 @@ class EvPrediction:
     meta: Dict[str, Any]
 
 
-def _minutes_to_start(ev: Dict[str, Any]) -> Optional[float]:
+@lru_cache(maxsize=4096)
+def _parse_iso(s: str) -> Optional[datetime]:
+    """
+    Parsea un ISO a datetime con tz (UTC si viene naive); None si no se puede.
+    Cacheado: varios mercados del mismo fixture comparten el mismo horario.
+    """
+    try:
+        # Ejemplo: "2025-11-16T13:00:00Z"
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+    return dt
+
+
+def _minutes_to_start(ev: Dict[str, Any], now: datetime) -> Optional[float]:
     """
     Calcula minutos hasta el inicio a partir de campos típicos.
     Compatible con el formato de ev-ndjson de punterx-core.
@@ -38,84 +81,42 @@ def _minutes_to_start(ev: Dict[str, Any]) -> Optional[float]:
     if not iso:
         return None
 
-    try:
-        s = str(iso)
-        # Ejemplo: "2025-11-16T13:00:00Z"
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        dt = datetime.fromisoformat(s)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-    except Exception:
+    dt = _parse_iso(str(iso))
+    if dt is None:
         return None
 
-    now = datetime.now(timezone.utc)
     return (dt - now).total_seconds() / 60.0
 
 
 def _is_big_league(name: Any) -> bool:
     if not name:
         return False
-    s = str(name).lower()
-    keywords = [
-        "world cup",
-        "champions league",
-        "premier league",
-        "la liga",
-        "serie a",
-        "bundesliga",
-        "ligue 1",
-        "europa league",
-    ]
-    return any(k in s for k in keywords)
-
-
-def _score_single(ev: Dict[str, Any]) -> float:
+    return _BIG_LEAGUE_RE.search(str(name)) is not None
+
+
+def score_events(events: List[Dict[str, Any]]) -> List[EvPrediction]:
     """
-    Heurística v1:
+    Aplica la heurística v1 a una lista de eventos:
     - Base 0.02.
     - Bumps por ventana de tiempo (hasta 7 días).
     - Bump por liga importante.
     """
-    base = 0.02
-    mins = _minutes_to_start(ev)
-
-    if mins is not None:
-        # convertimos mins a horas para hacerlo más cómodo
-        horas = mins / 60.0
-        dias = horas / 24.0
-
-        # 0 a 6 horas
-        if 0 <= horas <= 6:
-            base += 0.04
-        # 6 a 24 horas
-        elif 6 < horas <= 24:
-            base += 0.03
-        # 1 a 3 días
-        elif 1 < dias <= 3:
-            base += 0.02
-        # 3 a 7 días
-        elif 3 < dias <= 7:
-            base += 0.01
-        # más de 7 días → sin bump extra
-
-    if _is_big_league(ev.get("league")):
-        base += 0.015
-
-    # Cap y piso
-    ev_val = max(0.0, min(0.10, base))
-    return ev_val
-
-
-def score_events(events: List[Dict[str, Any]]) -> List[EvPrediction]:
-    """Aplica la heurística v1 a una lista de eventos."""
     out: List[EvPrediction] = []
+    now = datetime.now(timezone.utc)
 
     for idx, ev in enumerate(events or []):
         fixture_id = str(ev.get("fixture_id") or idx)
         market = ev.get("market") or "h2h"
 
-        ev_val = _score_single(ev)
+        base = 0.02
+        mins = _minutes_to_start(ev, now)
+        if mins is not None and mins >= 0:
+            base += _MIN_BUMPS[bisect_left(_MIN_EDGES, mins)]
+        if _is_big_league(ev.get("league")):
+            base += 0.015
+
+        # Cap y piso
+        ev_val = max(0.0, min(0.10, base))
         # Probabilidad modelo simple: 0.5 + EV (0.5..0.6)
         prob = 0.5 + ev_val
 